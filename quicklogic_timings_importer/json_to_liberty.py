@@ -3,16 +3,18 @@
 import argparse
 from pathlib import Path
 import json
+import os
 from . import log_printer
 import pprint
 import re
 
+# regex for floating-point literals that are written without quotes
+_FLOAT_LITERAL = re.compile(r'\d+\.\d+$')
+
 
 class JSONToLibertyWriter():
 
     _indtype = '  '
-    _indlevel = 0
-    _ind = ''
 
     class JSONToLibertyWriterException(Exception):
         '''Exception raised for errors in converting JSON to Liberty format.
@@ -31,106 +33,140 @@ class JSONToLibertyWriter():
             self.message += pprint.pformat(jsonentry[1], indent=2)
 
     @classmethod
-    def updateind(cls, diff):
-        cls._indlevel += diff
-        cls._ind = cls._indtype * cls._indlevel
-
-    @classmethod
-    def update(cls, lines, line):
-        lines.append(cls._ind + line)
+    def parse_entry(cls, rootkey, rootvalue, ind=''):
+        '''Generates the lines for dictionary containing Liberty group.
 
-    @classmethod
-    def parse_entry(cls, rootkey, rootvalue) -> list:
-        '''Recursively prints the dictionary containing Liberty group.
+        Parameters
+        ----------
+        rootkey: str
+            The key of the Liberty entry
+        rootvalue: object
+            The value of the Liberty entry
+        ind: str
+            The indentation prepended to every generated line
+
+        Yields
+        ------
+        str: Liberty line for given entry, without newline character
         '''
 
-        lines = []
-
-        if type(rootvalue) == list:
-            if 'comp_attribute ' in rootkey:
-                # repeated attributes with values grouped into list
-                for value in rootvalue:
-                    entrylines = cls.parse_entry(rootkey, value)
-                    lines.extend(entrylines)
-            else:
-                # we deal with list of values or i.e. timing entries
-                # first we check the types of entries
-                rootvaluetypes = sorted(list(set(
-                    [type(el).__name__ for el in rootvalue])))
-
-                if len(rootvaluetypes) == 1 and rootvaluetypes[0] == 'dict':
-                    # these are grouped structs with same name, we need to
-                    # repeat them
-                    for value in rootvalue:
-                        entrylines = cls.parse_entry(rootkey, value)
-                        lines.extend(entrylines)
-                elif not (False in
-                          set([typ in ['int', 'float']
-                               for typ in rootvaluetypes])):
-                    # these are numbers from array
-                    values = ', '.join([str(val) for val in rootvalue])
-                    cls.update(lines, '{} ("{}");'.format(rootkey, values))
-                elif len(rootvaluetypes) == 1 and rootvaluetypes[0] == 'list':
-                    # it's a two-dimensional array
-                    cls.update(lines, '{} ( \\'.format(rootkey))
-                    cls._ind = ' ' * (len(lines[-1]) - 2)
-                    for index, array in enumerate(rootvalue):
-                        arrstyle = ('"{}", \\'
-                                    if index != (len(rootvalue) - 1)
-                                    else '"{}" \\')
-                        arr = arrstyle.format(
-                                ', '.join([str(a) for a in array]))
-                        cls.update(lines, arr)
-                    cls.updateind(0)
-                    cls.update(lines, ");")
+        # the structure is walked with an explicit stack instead of recursion,
+        # stack holds either (key, value, indentation) entries to process or
+        # already formatted lines to emit
+        indtype = cls._indtype
+        # indentations of nested groups, computed once per nesting level
+        subinds = {}
+        stack = [(rootkey, rootvalue, ind)]
+        while stack:
+            entry = stack.pop()
+            if type(entry) is str:
+                yield entry
+                continue
+            rootkey, rootvalue, ind = entry
+
+            if type(rootvalue) == list:
+                if 'comp_attribute ' in rootkey:
+                    # repeated attributes with values grouped into list
+                    stack.extend(
+                            (rootkey, value, ind)
+                            for value in reversed(rootvalue))
                 else:
-                    for value in rootvalue:
-                        cls.update(lines, '{} ({});'.format(rootkey, value))
-
-        elif type(rootvalue) == dict:
-
-            # we need to process dict entries
-
-            if ' ' in rootkey:
-                keysplit = rootkey.split(' ', 1)
-                cls.update(lines, '{} ({}) {{'.format(
-                    keysplit[0], keysplit[1]))
-                for key, value in rootvalue.items():
-                    cls.updateind(+1)
-                    entrylines = cls.parse_entry(key, value)
-                    cls.updateind(-1)
-                    lines.extend(entrylines)
-                cls.update(lines, '}')
-            elif rootkey == 'define':
-                cls.update(lines, '{} ({},{},{});'.format(
-                    rootkey,
-                    rootvalue['attribute_name'],
-                    rootvalue['group_name'],
-                    rootvalue['attribute_type']))
-            else:
-                raise cls.JSONToLibertyWriterException(
-                        (rootkey, rootvalue),
-                        'JSON entry not parseable 1')
-        else:
-            # we possibly have simple types
-            if ' ' in rootkey:
-                # we should have a complex attribute
-                if 'comp_attribute' in rootkey:
-                    attrname = rootkey.split(' ', 1)[1]
-                    cls.update(lines, '{} ({});'.format(attrname, rootvalue))
+                    # we deal with list of values or i.e. timing entries
+                    # first we check the types of entries
+                    firsttype = type(rootvalue[0]) if rootvalue else None
+
+                    if (firsttype is dict
+                            and all(type(el) is dict for el in rootvalue)):
+                        # these are grouped structs with same name, we need to
+                        # repeat them
+                        stack.extend(
+                                (rootkey, value, ind)
+                                for value in reversed(rootvalue))
+                    elif all(type(el) in (int, float) for el in rootvalue):
+                        # these are numbers from array
+                        values = ', '.join(map(str, rootvalue))
+                        yield f'{ind}{rootkey} ("{values}");'
+                    elif (firsttype is list
+                            and all(type(el) is list for el in rootvalue)):
+                        # it's a two-dimensional array
+                        line = f'{ind}{rootkey} ( \\'
+                        yield line
+                        arrind = ' ' * (len(line) - 2)
+                        last = len(rootvalue) - 1
+                        for index, array in enumerate(rootvalue):
+                            arr = ', '.join(map(str, array))
+                            sep = ',' if index != last else ''
+                            yield f'{arrind}"{arr}"{sep} \\'
+                        yield f'{ind});'
+                    else:
+                        for value in rootvalue:
+                            yield f'{ind}{rootkey} ({value});'
+
+            elif type(rootvalue) == dict:
+
+                # we need to process dict entries
+
+                if ' ' in rootkey:
+                    keysplit = rootkey.split(' ', 1)
+                    yield f'{ind}{keysplit[0]} ({keysplit[1]}) {{'
+                    # the closing brace is emitted after all group entries
+                    stack.append(f'{ind}}}')
+                    subind = subinds.get(ind)
+                    if subind is None:
+                        subind = subinds[ind] = ind + indtype
+                    stack.extend(
+                            (key, value, subind)
+                            for key, value in reversed(rootvalue.items()))
+                elif rootkey == 'define':
+                    attrname = rootvalue['attribute_name']
+                    groupname = rootvalue['group_name']
+                    attrtype = rootvalue['attribute_type']
+                    yield (f'{ind}{rootkey} '
+                           f'({attrname},{groupname},{attrtype});')
                 else:
-                    # there is some issue
                     raise cls.JSONToLibertyWriterException(
                             (rootkey, rootvalue),
-                            'JSON entry not parseable 2')
+                            'JSON entry not parseable 1')
             else:
-                if ((type(rootvalue) is str)
-                        and not re.match(r'^\d+\.\d+$', rootvalue)
-                        and rootvalue not in ["true", "false"]):
-                    cls.update(lines, '{} : "{}";'.format(rootkey, rootvalue))
+                # we possibly have simple types
+                if ' ' in rootkey:
+                    # we should have a complex attribute
+                    if 'comp_attribute' in rootkey:
+                        attrname = rootkey.split(' ', 1)[1]
+                        yield f'{ind}{attrname} ({rootvalue});'
+                    else:
+                        # there is some issue
+                        raise cls.JSONToLibertyWriterException(
+                                (rootkey, rootvalue),
+                                'JSON entry not parseable 2')
                 else:
-                    cls.update(lines, '{} : {};'.format(rootkey, rootvalue))
-        return lines
+                    if ((type(rootvalue) is str)
+                            and not (rootvalue[:1].isdigit()
+                                     and _FLOAT_LITERAL.match(rootvalue))
+                            and rootvalue not in ["true", "false"]):
+                        yield f'{ind}{rootkey} : "{rootvalue}";'
+                    else:
+                        yield f'{ind}{rootkey} : {rootvalue};'
+
+    @classmethod
+    def generate_liberty_lines(cls, jsondict: dict):
+        '''Generates Liberty format lines from JSON-like dictionary.
+
+        Parameters
+        ----------
+        jsondict: dict
+            JSON-like dictionary containing timing content parsable by Liberty
+
+        Yields
+        ------
+        str: Liberty line, without newline character
+        '''
+        if len(jsondict) != 1:
+            raise cls.JSONToLibertyWriterException(
+                    (None, None),
+                    'JSON have multiple root objects')
+        for key, value in jsondict.items():
+            yield from cls.parse_entry(key, value)
 
     @classmethod
     def convert_json_to_liberty(cls, jsondict: dict, indent=2) -> list:
@@ -145,15 +181,7 @@ class JSONToLibertyWriter():
         -------
         list: list of string lines containing Liberty result
         '''
-        lines = []
-        if len(list(jsondict.keys())) != 1:
-            raise cls.JSONToLibertyWriterException(
-                    (None, None),
-                    'JSON have multiple root objects')
-        else:
-            for key, value in jsondict.items():
-                lines = JSONToLibertyWriter.parse_entry(key, value)
-        return lines
+        return list(cls.generate_liberty_lines(jsondict))
 
 
 def main():
@@ -180,13 +208,23 @@ def main():
     with open(args.input, 'r') as infile:
         jsondict = json.load(infile)
 
+    # lines are streamed to a temporary file next to the output, which
+    # replaces the output only when the whole library was generated, so a
+    # failed conversion leaves no partial file and keeps a previous output
+    tmpoutput = args.output.with_name(
+            '.{}.{}.tmp'.format(args.output.name, os.getpid()))
     try:
-        liblines = JSONToLibertyWriter.convert_json_to_liberty(jsondict)
-        if liblines:
-            with open(args.output, 'w') as out:
-                out.write('\n'.join(liblines))
+        # the large buffer coalesces the lines into few writes
+        with open(tmpoutput, 'w', buffering=1 << 20) as out:
+            out.writelines(
+                    line + '\n' for line in
+                    JSONToLibertyWriter.generate_liberty_lines(jsondict))
+        os.replace(tmpoutput, args.output)
     except JSONToLibertyWriter.JSONToLibertyWriterException as ex:
         log_printer.log('ERROR', ex.message)
+    finally:
+        if tmpoutput.exists():
+            tmpoutput.unlink()
 
 
 if __name__ == '__main__':
@@ -1,15 +1,36 @@
 import difflib
+from collections import Counter
 import argparse
 from pathlib import Path
 import re
 from . import log_printer
 
+try:
+    import diff_match_patch
+except ImportError:
+    diff_match_patch = None
+
+# regex for comments (C/C++ style)
+_CCOMMENT = re.compile(r'(?:\/\*(.*?)\*\/)|(?:\/\/(.*?))', re.DOTALL)
+
+# regex for comments (Python style)
+_PYCOMMENT = re.compile(r'#[^\n]*\n')
+
+# regex for non-whitespace content after closing brace
+_BRACE_NL = re.compile(r'}\s*(?!\n)')
+
+# regex for line breaks
+_LINEBREAK = re.compile(r'\\\s*\n')
+
+# regex for numbers
+_FLOATS = re.compile(r'(?P<number>[-+]?[0-9]*\.?[0-9]+([eE][-+]?[0-9]+)?)')
+
+# characters ignored by the character-level diff
+_JUNK_CHARACTERS = frozenset(' \t"')
+
 
 def junk_characters(a):
-    if a in ' \t\"':
-        return True
-    else:
-        return False
+    return a in _JUNK_CHARACTERS
 
 
 def clean_lines(
@@ -22,14 +43,46 @@ def clean_lines(
         remove_line_breaks=True):
     '''Performs file preprocessing before running diff.
 
+    Joins the lines and runs `clean_text` on the result, see `clean_text` for
+    details.
+
+    Parameters
+    ----------
+    lines: list
+        list of Liberty lines to clean
+
+    Returns
+    -------
+    list: cleaned lines
+    '''
+    return clean_text(
+            '\n'.join(lines),
+            remove_comments,
+            move_entry_to_newline,
+            remove_quotes,
+            remove_whitespaces,
+            unify_numbers,
+            remove_line_breaks)
+
+
+def clean_text(
+        fullfile,
+        remove_comments=True,
+        move_entry_to_newline=True,
+        remove_quotes=True,
+        remove_whitespaces=True,
+        unify_numbers=True,
+        remove_line_breaks=True):
+    '''Performs file preprocessing before running diff.
+
     It is used for removing all semantically irrelevant characters that may
     blur the real differences between two files. By default it converts all
     tabs to single whitespace.
 
     Parameters
     ----------
-    lines: list
-        list of Liberty lines to clean
+    fullfile: str
+        contents of Liberty file to clean
     remove_comments: bool
         removes comments if True
     move_entry_to_newline: bool
@@ -49,34 +102,43 @@ def clean_lines(
     -------
     list: cleaned lines
     '''
-    # join all lines into single string
-    fullfile = '\n'.join(lines)
-
     if remove_comments:
         # remove comments (C/C++ style)
-        fullfile = re.sub(r'(?:\/\*(.*?)\*\/)|(?:\/\/(.*?))', '',
-                          fullfile, flags=re.DOTALL)
+        fullfile = _CCOMMENT.sub('', fullfile)
 
         # remove comments (Python style)
-        fullfile = re.sub(r'#[^\n]*\n', '', fullfile, flags=re.DOTALL)
-
-    # replace all tabs with single space
-    fullfile = fullfile.replace('\t', ' ')
+        fullfile = _PYCOMMENT.sub('', fullfile)
 
     if move_entry_to_newline:
         # move non-whitespace content after } to new line
-        fullfile = re.sub(r'}\s*(?!\n)', '}\n', fullfile, flags=re.DOTALL)
+        fullfile = _BRACE_NL.sub('}\n', fullfile)
 
+    # replace all tabs with single space, remove quotes and whitespaces, all
+    # in a single pass over the file
+    translation = {'\t': ' '}
     if remove_quotes:
-        # remove quotes
-        fullfile = fullfile.replace('"', '')
-
+        translation['"'] = None
     if remove_whitespaces:
-        # remove whitespaces
-        fullfile = fullfile.replace(' ', '')
+        translation['\t'] = None
+        translation[' '] = None
+    fullfile = fullfile.translate(str.maketrans(translation))
 
     if remove_line_breaks:
-        fullfile = re.sub(r'\\\s*\n', '', fullfile, flags=re.DOTALL)
+        fullfile = _LINEBREAK.sub('', fullfile)
+
+    if unify_numbers:
+        # timing tables repeat the same values many times, so conversions
+        # are cached by their original notation
+        unified = {}
+
+        def unify_number(m):
+            number = m.group('number')
+            result = unified.get(number)
+            if result is None:
+                result = unified[number] = str(float(number))
+            return result
+
+        fullfile = _FLOATS.sub(unify_number, fullfile)
 
     # split single string into lines
     lines = fullfile.split('\n')
@@ -86,14 +148,6 @@ def clean_lines(
         # remove empty lines and trailing whitespaces
         lines = [line.rstrip() for line in lines if line.strip()]
 
-    if unify_numbers:
-        floats = re.compile(
-                r'(?P<number>[-+]?[0-9]*\.?[0-9]+([eE][-+]?[0-9]+)?)')
-        for i in range(len(lines)):
-            lines[i] = floats.sub(
-                    lambda m: str(float(m.group('number'))),
-                    lines[i])
-
     # add newlines at the end of each line
     lines = [line + '\n' for line in lines]
 
@@ -132,9 +186,17 @@ def diff_files(
     similarity_method: str
         Method used for computing similarity measure. Values can be:
         * normal - slow, exact comparison,
-        * quick - faster, less exact comparison that returns upper bound for
-            normal similarity ratio
-        * real_quick - very fast, very inaccurate
+        * quick - faster, less exact comparison, returns upper bound for
+            normal similarity ratio computed from the characters common to
+            both files, regardless of their order
+        * lines - fast comparison that computes the ratio of lines common to
+            both files, regardless of their order
+        * real_quick - very fast, very inaccurate, returns upper bound for
+            normal similarity ratio computed from the lengths of files
+        * levenshtein - exact comparison based on Levenshtein distance
+            computed by `diff_match_patch` without a time limit, it is pure
+            Python and slow for large files (falls back to normal if the
+            module is not available)
 
     Returns
     -------
@@ -156,13 +218,47 @@ def diff_files(
                 charjunk=junk_characters)
         print(''.join(diff))
     if return_similarity:
-        seqmatcher = difflib.SequenceMatcher(None, ''.join(in1), ''.join(in2))
+        if similarity_method == 'levenshtein' and diff_match_patch is None:
+            log_printer.log(
+                    'WARNING',
+                    'diff_match_patch not available, using normal method')
+            similarity_method = 'normal'
+        if similarity_method in ('normal', 'levenshtein', 'quick'):
+            # the character-based methods work on whole documents, join the
+            # lines only once
+            text1 = ''.join(in1)
+            text2 = ''.join(in2)
         if similarity_method == 'normal':
+            seqmatcher = difflib.SequenceMatcher(None, text1, text2)
             return seqmatcher.ratio()
+        elif similarity_method == 'levenshtein':
+            longest = max(len(text1), len(text2))
+            if longest == 0:
+                return 1.0
+            dmp = diff_match_patch.diff_match_patch()
+            # the default timeout returns a partial diff after one second,
+            # which would make the result depend on the machine speed
+            dmp.Diff_Timeout = 0
+            diffs = dmp.diff_main(text1, text2, False)
+            return 1.0 - dmp.diff_levenshtein(diffs) / longest
         elif similarity_method == 'quick':
-            return seqmatcher.quick_ratio()
+            # same value as SequenceMatcher.quick_ratio, without building
+            # the matcher's index of the second document
+            if not text1 and not text2:
+                return 1.0
+            common = Counter(text1) & Counter(text2)
+            return 2.0 * sum(common.values()) / (len(text1) + len(text2))
+        elif similarity_method == 'lines':
+            if not in1 and not in2:
+                return 1.0
+            common = Counter(in1) & Counter(in2)
+            return 2.0 * sum(common.values()) / (len(in1) + len(in2))
         elif similarity_method == 'real_quick':
-            return seqmatcher.real_quick_ratio()
+            len1 = sum(map(len, in1))
+            len2 = sum(map(len, in2))
+            if len1 + len2 == 0:
+                return 1.0
+            return 2.0 * min(len1, len2) / (len1 + len2)
 
 
 if __name__ == '__main__':
@@ -218,10 +314,14 @@ if __name__ == '__main__':
             action="store_true")
     parser.add_argument(
             "--similarity-method",
-            help="The method used for computing similarity",
+            help="The method used for computing similarity: normal (exact), "
+                 "quick (upper bound from common characters), real_quick "
+                 "(upper bound from lengths), lines (ratio of common lines, "
+                 "ignoring their order) or levenshtein (exact Levenshtein "
+                 "distance, pure Python and slow on large files)",
             type=str,
             default='quick',
-            choices=['normal', 'quick', 'real_quick'])
+            choices=['normal', 'quick', 'real_quick', 'lines', 'levenshtein'])
     parser.add_argument(
             "--log-suppress-below",
             help="The mininal not suppressed log level",
@@ -234,11 +334,11 @@ if __name__ == '__main__':
     log_printer.SUPPRESSBELOW = args.log_suppress_below
 
     with open(args.input1, 'r') as input1:
-        in1 = input1.readlines()
+        in1 = input1.read()
     with open(args.input2, 'r') as input2:
-        in2 = input2.readlines()
+        in2 = input2.read()
 
-    in1 = clean_lines(
+    in1 = clean_text(
             in1,
             not args.not_remove_comments,
             not args.not_move_entry_to_newline,
@@ -247,7 +347,7 @@ if __name__ == '__main__':
             not args.not_unify_numbers,
             not args.not_remove_line_breaks)
 
-    in2 = clean_lines(
+    in2 = clean_text(
             in2,
             not args.not_remove_comments,
             not args.not_move_entry_to_newline,
@@ -1,14 +1,98 @@
 #!/usr/bin/env python3
 
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import json
 import re
+import sys
 from . import log_printer
 
+# regex for variables
+_VARDEF = r'([A-Za-z_][a-zA-Z_0-9\-]*)'
+
+# regex for floating-point numbers, the integer part and the fraction cannot
+# trade digits, so a failed match does not retry every split of the number
+_NUMDEF = r'[-+]?(?:[0-9]+(?:\.[0-9]+)?|\.[0-9]+)([eE][-+]?[0-9]+)?'
+
+# regex for lists of numbers, numbers are separated by mandatory commas and
+# the optional trailing comma takes no whitespace, so whitespace around the
+# list is left entirely to the enclosing pattern
+_NUMLISTDEF = r'{numdef}(?:,\s*{numdef})*,?'.format(numdef=_NUMDEF)
+
+# regex for arrays, the whitespace before an array is matched only by its
+# leading \s* and the whitespace before the separating comma only by the
+# optional separator, so a sequence of arrays can be split in one way only
+_ARRDEF = r'\s*\"\s*(?P<arrvalues>{numlist})\s*\"(?:\s*,)?'.format(numlist=_NUMLISTDEF)  # noqa: E501
+
+# REGEX defining the beginning of a statement, i.e. "name :", "name (" or
+# the closing brace of the group
+_STATEMENT = re.compile(r'\s*(?:(?P<close>}})|(?:\"(?P<qname>{vardef})\"|(?P<name>{vardef}))\s*(?P<kind>[:(]))'.format(vardef=_VARDEF), re.ASCII)  # noqa: E501
+
+# REGEX defining the value of "name : value;" attributes
+_ATT_VALUE = re.compile(r'[^\S\n]*(?:\"(?P<valueq>[^\"]*)\"|(?P<value>[^\n\";}]*))[^\S\n]*;?', re.ASCII)  # noqa: E501
+
+# REGEX defining the arguments of "name (arguments)" statements, possibly
+# containing quoted strings and parenthesized values, i.e. "(name_(0))",
+# followed either by the opening brace of the group or by the semicolon
+_ARGUMENTS = re.compile(r'(?P<args>[^()\"]*(?:(?:\"[^\"]*\"|\([^()]*\))[^()\"]*)*)\)\s*(?:(?P<group>{)|;?)', re.ASCII)  # noqa: E501
+
+# REGEX defining the arguments of Liberty `define` statements
+_DEF_ARGS = re.compile(r'(?P<attribute_name>{vardef})\s*,\s*(?P<group_name>{vardef})\s*,\s*(?P<attribute_type>{vardef})'.format(vardef=_VARDEF), re.ASCII)  # noqa: E501
+
+# REGEX defining arguments being lists of arrays for lu_table_template
+# template breakpoints, i.e. "1.0, 2.0", "3.0, 4.0"
+_ARR_ARGS = re.compile(r'(?:{arrdef})+\s*'.format(arrdef=_ARRDEF), re.ASCII)
+
+# REGEX defining quoted attribute values being lists of numbers
+_SINGLE_ARR = re.compile(r'\s*(?P<arrvalues>{numlist})\s*'.format(numlist=_NUMLISTDEF), re.ASCII)  # noqa: E501
+
+# regex for arrays assigned to variables, i.e. "[1.0, 2.0]"
+_BRACKETDEF = r'\[\s*(?P<arrvalues>{numlist})\s*\]'.format(numlist=_NUMLISTDEF)
+
+# REGEX defining arrays assigned to variables
+_SINGLE_ARR_DEF = re.compile(_BRACKETDEF, re.ASCII)
+
+# REGEX defining arrays of arrays assigned to variables, i.e.
+# "[[1.0, 2.0], [3.0]]"
+_MULTI_ARR_DEF = re.compile(r'\[\s*{bracket}(?:\s*,\s*{bracket})*\s*\]'.format(bracket=r'\[\s*{}\s*\]'.format(_NUMLISTDEF)), re.ASCII)  # noqa: E501
+
+# REGEX defining the opening brace of the root group
+_ROOT_OPEN = re.compile(r'\s*{', re.ASCII)
+
+# REGEX defining whitespaces
+_WHITESPACES = re.compile(r'\s*', re.ASCII)
+
+# REGEX defining comments (C/C++ style), comments (Python style) and line
+# breaks, all removed in a single pass, line comments keep the ending newline
+_COMMENT_OR_LINEBREAK = re.compile(r'\/\*.*?\*\/|\/\/[^\n]*|#[^\n]*|\\\s*', re.DOTALL | re.ASCII)  # noqa: E501
+
+# marker for keys not present in dictionary
+_MISSING = object()
+
 
 class LibertyToJSONParser():
 
+    class LibertyToJSONParserException(Exception):
+        '''Exception raised for errors in parsing Liberty files.
+
+        Attributes
+        ----------
+        lineno: int
+            The line of the preprocessed Liberty file where parsing failed
+        message: str
+            A message included with the exception
+        '''
+        def __init__(self, lineno, message):
+            self.lineno = lineno
+            self.message = message
+            super().__init__(message)
+
+        def __reduce__(self):
+            # recreate the exception from both arguments when it is passed
+            # from a worker process
+            return (type(self), (self.lineno, self.message))
+
     @classmethod
     def join_duplicate_keys(cls, ordered_pairs) -> dict:
         '''Converts multiple key-value entries in input sequence to one entry.
@@ -27,230 +111,257 @@ class LibertyToJSONParser():
         '''
         d = {}
         for k, v in ordered_pairs:
-            if k in d:
-                if type(d[k]) == list:
-                    d[k].append(v)
-                else:
-                    if d[k] != v:
-                        d[k] = [d[k], v]
-            else:
+            # single lookup, _MISSING tells absent keys from None values
+            existing = d.get(k, _MISSING)
+            if existing is _MISSING:
                 d[k] = v
+            elif isinstance(existing, list):
+                existing.append(v)
+            elif existing != v:
+                d[k] = [existing, v]
         return d
 
     @classmethod
-    def load_timing_info_from_lib(cls, libfile: list) -> (dict):
-        '''Reads the LIB file and converts it to dictionary structure.
+    def parse_numbers(cls, arrvalues: str) -> list:
+        '''Converts comma-separated numbers to the list of numbers.
+
+        Numbers without fraction and exponent are converted to int, the
+        remaining ones are converted to float.
 
         Parameters
         ----------
-        libfile: list
-            The lines for input LIB file
+        arrvalues: str
+            comma-separated numbers, i.e. "1.0, 2.0, 3"
 
         Returns
         -------
-            dict: a dictionary containing the whole structure of the file
+        list: list of numbers
         '''
+        numbers = []
+        for value in arrvalues.split(','):
+            value = value.strip()
+            if not value:
+                continue
+            if '.' in value or 'e' in value or 'E' in value:
+                numbers.append(float(value))
+            else:
+                numbers.append(int(value))
+        return numbers
 
-        # regex for indent
-        inddef = r'^(?P<indent>\s*)'
-
-        # regex for variables
-        vardef = r'([A-Za-z_][a-zA-Z_0-9\-]*)'
+    @classmethod
+    def parse_error(cls, text: str, pos: int):
+        '''Creates exception for the unexpected content in Liberty file.
 
-        # regex for floating-point numbers
-        numdef = r'[-+]?[0-9]*\.?[0-9]+([eE][-+]?[0-9]+)?'
+        Parameters
+        ----------
+        text: str
+            The preprocessed Liberty file
+        pos: int
+            The position where parsing failed
 
-        # regex for all allowed characters in struct definition name
-        alloweddef = r'[^\n\"{{]+'
+        Returns
+        -------
+        LibertyToJSONParserException: exception describing the failure
+        '''
+        pos = _WHITESPACES.match(text, pos).end()
+        lineno = text.count('\n', 0, pos) + 1
+        content = text[pos:].split('\n', 1)[0]
+        return cls.LibertyToJSONParserException(
+                lineno,
+                'Unexpected Liberty content in line {}: {}'.format(
+                    lineno,
+                    content if content else 'end of file'))
 
-        # regex for arrays
-        arrdef = r'(\s*\"\s*(?P<arrvalues>({numdef}(,\s*)?)+)\s*\"\s*,?)'.format(numdef=numdef)  # noqa: E501
+    @classmethod
+    def parse_group(cls, text: str, pos: int) -> (dict, int):
+        '''Parses the statements of Liberty group up to its closing brace.
 
-        # REGEX defining the dictionary name in LIB file, i.e. "pin ( QAI )",
-        # "pin(FBIO[22])" or "timing()"
-        structdecl = re.compile(r'{inddef}(?P<type>{vardef})\s*\(\s*(\"(?P<nameq>[^\n{{]+?)?\"|(?P<name>[^\n{{]+?)?)\s*\)'.format(vardef=vardef, inddef=inddef, alloweddef=alloweddef))  # noqa: E501
+        Groups are converted to entries with "type name" keys and dictionary
+        values, complex attributes are converted to "comp_attribute name"
+        keys with string values, arrays are converted to lists of numbers and
+        simple attributes are converted to string values.
 
-        # REGEX defining global "attribute (entry);" statements
-        attdecl = re.compile(r'{inddef}(?P<attrname>{vardef})\s*\(\s*(\"(?P<attrvalq>[^\n\(\)]+?)\"|(?P<attrval>[^\n\(\)]+?))\s*\)\s*,$'.format(vardef=vardef, inddef=inddef))  # noqa: E501
+        Parameters
+        ----------
+        text: str
+            The preprocessed Liberty file
+        pos: int
+            The position right after the opening brace of the group
 
-        # REGEX defining array for lu_table_template template breakpoints
-        arrdecl = re.compile(r'{inddef}(?P<arrname>{vardef})\s*\((?P<array>{arrdef}+)\)'.format(vardef=vardef, inddef=inddef, arrdef=arrdef))  # noqa: E501
+        Returns
+        -------
+        (dict, int): dictionary with the group contents and the position right
+            after the closing brace of the group
+        '''
+        # entries are merged as they are parsed, the same way as in
+        # join_duplicate_keys, without collecting the pairs first
+        entries = {}
+        while True:
+            statement = _STATEMENT.match(text, pos)
+            if not statement:
+                raise cls.parse_error(text, pos)
+            pos = statement.end()
+            if statement.group('close'):
+                return entries, pos
+
+            # attribute names repeat throughout the file, interning shares
+            # them between entries and lets lookups with literal keys match
+            # by identity
+            name = key = sys.intern(statement.group('name')
+                                    or statement.group('qname'))
+            if statement.group('kind') == ':':
+                # simple "name : value;" attribute
+                attmatch = _ATT_VALUE.match(text, pos)
+                pos = attmatch.end()
+                value = attmatch.group('valueq')
+                # quoted lists of numbers assigned to quoted names are
+                # converted to arrays
+                arrmatch = (_SINGLE_ARR.fullmatch(value)
+                            if value is not None and statement.group('qname')
+                            else None)
+                if arrmatch:
+                    value = cls.parse_numbers(arrmatch.group('arrvalues'))
+                else:
+                    if value is None:
+                        value = attmatch.group('value')
+                    value = value.strip()
+                    if value[:1] == '[':
+                        # bracketed arrays are converted to lists of numbers
+                        arrmatch = _SINGLE_ARR_DEF.fullmatch(value)
+                        if arrmatch:
+                            value = cls.parse_numbers(
+                                    arrmatch.group('arrvalues'))
+                        elif _MULTI_ARR_DEF.fullmatch(value):
+                            value = [
+                                    cls.parse_numbers(match.group('arrvalues'))
+                                    for match in _SINGLE_ARR_DEF.finditer(
+                                        value)]
+            else:
+                argmatch = _ARGUMENTS.match(text, pos)
+                if not argmatch:
+                    raise cls.parse_error(text, pos)
+                pos = argmatch.end()
+                args = argmatch.group('args').strip()
+
+                defmatch = (_DEF_ARGS.fullmatch(args) if name == 'define'
+                            else None)
+                if argmatch.group('group'):
+                    # "type (name) {" group
+                    if len(args) >= 2 and args[0] == args[-1] == '"':
+                        args = args[1:-1]
+                    key = f'{name} {args}'
+                    value, pos = cls.parse_group(text, pos)
+                elif defmatch:
+                    # "define (attribute, group, type);" statement
+                    value = defmatch.groupdict()
+                elif _ARR_ARGS.fullmatch(args):
+                    # "name ("1, 2", "3, 4");" array, single array is not
+                    # nested, every second part of the arguments split by
+                    # quotes is the list of numbers
+                    value = [cls.parse_numbers(arrvalues)
+                             for arrvalues in args.split('"')[1::2]]
+                    if len(value) == 1:
+                        value = value[0]
+                else:
+                    # "name (value);" complex attribute
+                    if len(args) >= 3 and args[0] == args[-1] == '"':
+                        args = args[1:-1]
+                    key = f'comp_attribute {name}'
+                    value = args
+
+            # single lookup, _MISSING tells absent keys from None values
+            existing = entries.get(key, _MISSING)
+            if existing is _MISSING:
+                entries[key] = value
+            elif isinstance(existing, list):
+                existing.append(value)
+            elif existing != value:
+                entries[key] = [existing, value]
 
-        # REGEX defining arrays
-        subarrdecl = re.compile(arrdef)
+    @classmethod
+    def load_timing_info_from_lib(cls, libfile: list) -> (dict):
+        '''Reads the LIB file and converts it to dictionary structure.
 
-        singlearr = re.compile(r'{inddef}\"(?P<arrname>{vardef})\"\s*:{arrdef}'.format(vardef=vardef, inddef=inddef, arrdef=arrdef))  # noqa: E501
+        Joins the lines and runs `load_timing_info_from_text` on the result,
+        see `load_timing_info_from_text` for details.
 
-        # REGEX defining Liberty `define` statements
-        defdecl = re.compile(r'{inddef}define\s*\(\s*(?P<attribute_name>{vardef})\s*,\s*(?P<group_name>{vardef})\s*,\s*(?P<attribute_type>{vardef})\s*\)\s*,'.format(vardef=vardef, inddef=inddef))  # noqa: E501
+        Parameters
+        ----------
+        libfile: list
+            The lines for input LIB file
 
-        # REGEX defining lines with no ending colon
-        nocommadecl = re.compile(r'(?P<content>{inddef}{vardef}\s*:\s*(\"[^\n\"\(\)]+\"|[^\n\s\"\(\),]+))\s*$'.format(inddef=inddef, vardef=vardef))  # noqa: E501
+        Returns
+        -------
+            dict: a dictionary containing the whole structure of the file
+        '''
+        return cls.load_timing_info_from_text('\n'.join(libfile))
 
-        # REGEX defining typical variable name, which is any variable starting
-        # with alphabetic character, followed by [A-Za-z_0-9] characters, and
-        # not within quotes
-        unwrappeddecl = re.compile(r'{inddef}(\"(?P<varnameq>{vardef})\"|(?P<varname>{vardef}))\s*:\s*(\"(?P<varvalueq>[^\n\"{{]*)\"|(?P<varvalue>[^\n\"{{]*))\s*,$'.format(inddef=inddef, vardef=vardef))  # noqa: E501
-        # vardecl = re.compile(r'(?P<variable>(?<!\"){vardef}(\[[0-9]+\])?(?![^\:]*\"))'.format(vardef=vardef))  # noqa: E501
+    @classmethod
+    def load_timing_info_from_text(cls, fullfile: str) -> (dict):
+        '''Reads the LIB file contents and converts it to dictionary structure.
 
-        # join all lines into single string
-        fullfile = '\n'.join(libfile)
+        The contents of the file are expected to be enclosed in braces.
 
-        # remove comments (C/C++ style)
-        
-        fullfile = re.sub(r'(?:\/\*(.*?)\*\/)', '',
-                          fullfile, flags=re.DOTALL)
-        
-        fullfile = re.sub(r'(?:\/\/(.*?)\n)', '\n',
-                          fullfile, flags=re.DOTALL)
+        Parameters
+        ----------
+        fullfile: str
+            The contents of input LIB file
 
-        # remove comments (Python style)
-        fullfile = re.sub(r'#[^\n]*\n', '', fullfile, flags=re.DOTALL)
+        Returns
+        -------
+            dict: a dictionary containing the whole structure of the file
+        '''
 
-        # remove line breaks
-        fullfile = re.sub(r'\\[\s\n\r\t]*', '', fullfile, flags=re.DOTALL)
+        # remove comments (C/C++ and Python style) and line breaks
+        fullfile = _COMMENT_OR_LINEBREAK.sub('', fullfile)
 
         # replace all tabs with single space
         fullfile = fullfile.replace('\t', ' ')
 
-        # move non-whitespace content after } to new line
-        fullfile = re.sub(r'}\s*(?!\n)', '}\n', fullfile, flags=re.DOTALL)
-
-        # split single string into lines
-        libfile = fullfile.split('\n')
-        fullfile = ''
-
-        # replace semicolons with commas
-        libfile = [line.replace(';', ',') for line in libfile]
-
-        # remove empty lines and trailing whitespaces
-        libfile = [line.rstrip() for line in libfile if line.strip()]
-
-        for i in range(len(libfile)):
-            # add comma if not present
-            # TODO: not sure if this should be accepted or returned as error
-            libfile[i] = nocommadecl.sub(r'\g<content>,', libfile[i])
-
-            # parse `define` entries
-            libfile[i] = defdecl.sub(
-                    r'\g<indent>"define" : {"attribute_name": '
-                    r'"\g<attribute_name>", "group_name": "\g<group_name>", '
-                    r'"attribute_type": "\g<attribute_type>"}',
-                    libfile[i])
-
-            # parse array entries to make them JSON-compliant
-            arrmatch = arrdecl.match(libfile[i])
-            if arrmatch:
-                arrays = ''
-
-                first = True
-                matches = [match for match in
-                           subarrdecl.finditer(arrmatch.group("array"))]
-                for match in matches:
-                    if first:
-                        if len(matches) == 1:
-                            arrays = '{}'.format(match.group('arrvalues'))
-                        else:
-                            arrays = '[{}]'.format(match.group('arrvalues'))
-                        first = False
-                    else:
-                        arrays += ', [{}]'.format(match.group('arrvalues'))
-
-                libfile[i] = '{indent}{arrname} : [{arrays}],'.format(
-                        indent=arrmatch.group('indent'),
-                        arrname=arrmatch.group('arrname'),
-                        arrays=arrays)
-
-            # convert array-like attributes to arrays
-            # log_printer.log('INFO', libfile[i])
-            libfile[i] = singlearr.sub(
-                    r'\g<indent>"\g<arrname>" : [\g<arrvalues>],',
-                    libfile[i])
-
-            # parse attribute entries
-            attmatch = attdecl.match(libfile[i])
-            if attmatch:
-                libfile[i] = '{}"comp_attribute {}" : "{}",'.format(
-                        attmatch.group("indent"),
-                        attmatch.group("attrname"),
-                        (attmatch.group("attrval")
-                            if attmatch.group("attrval") else
-                            attmatch.group("attrvalq")).replace('"', '\\"'))
-
-            # remove parenthesis from struct names
-            structmatch = structdecl.match(libfile[i])
-            if structmatch:
-                if structmatch.group("name") or structmatch.group("nameq"):
-                    libfile[i] = '{}"{} {}" : {}'.format(
-                            structmatch.group("indent"),
-                            structmatch.group("type"),
-                            (structmatch.group("name") if
-                                structmatch.group("name") else
-                                structmatch.group("nameq")).replace(
-                                    '"', '\\"'),
-                            '{' if libfile[i].rstrip().endswith('{') else '')
-                else:
-                    libfile[i] = structdecl.sub(
-                            r'\g<indent>"\g<type> " :',
-                            libfile[i])
-
-            # wrap all text in quotes
-            unwrappedmatch = unwrappeddecl.match(libfile[i])
-            if unwrappedmatch:
-                singlearrdef = r'\[?\s*(\[\s*(?P<arrvalues>({numdef}(,\s*)?)+)\s*\])+\s*\]?'.format(numdef=numdef)  # noqa: E501
-                varval = (unwrappedmatch.group('varvalue')
-                          if unwrappedmatch.group('varvalue')
-                          else unwrappedmatch.group('varvalueq'))
-                varnam = (unwrappedmatch.group('varname')
-                          if unwrappedmatch.group('varname')
-                          else unwrappedmatch.group('varnameq'))
-                isarray = re.match(
-                        singlearrdef,
-                        varval)
-                if isarray:
-                    libfile[i] = '{}"{}" : {},'.format(
-                            unwrappedmatch.group('indent'),
-                            varnam,
-                            varval.strip())
-                else:
-                    libfile[i] = '{}"{}" : "{}",'.format(
-                            unwrappedmatch.group('indent'),
-                            varnam,
-                            varval.strip())
+        # the statements are parsed in a single pass over the file directly
+        # into the dictionary
+        rootmatch = _ROOT_OPEN.match(fullfile)
+        if not rootmatch:
+            raise cls.parse_error(fullfile, 0)
+        timingdict, pos = cls.parse_group(fullfile, rootmatch.end())
+        pos = _WHITESPACES.match(fullfile, pos).end()
+        if pos != len(fullfile):
+            raise cls.parse_error(fullfile, pos)
 
-            # add colons after closing braces
-            libfile[i] = libfile[i].replace("}", "},")
+        return timingdict
 
-        # remove colons before closing braces
-        fullfile = '\n'.join(libfile)
-        fullfile = re.sub(
-                r',(?P<tmp>\s*})', r'\g<tmp>',
-                fullfile,
-                flags=re.DOTALL)
-        libfile = fullfile.split('\n')
-        fullfile = ''
 
-        # remove the colon in the end of file
-        libfile[-1] = re.sub(r',\s*', '', libfile[-1])
+def parse_lib_file(libpath: Path):
+    '''Reads the LIB file from disk and converts it to dictionary structure.
 
-        with open('out.dbg', 'w') as dbg:
-            dbg.write('\n'.join(libfile))
+    Parameters
+    ----------
+    libpath: Path
+        The path to the LIB file
 
-        timingdict = json.loads('\n'.join(libfile),
-                                object_pairs_hook=cls.join_duplicate_keys)
-
-        return timingdict
+    Returns
+    -------
+    (dict, str): a dictionary containing the whole structure of the file and
+        None, or None and the error message if the file could not be parsed
+    '''
+    libfile = '{\n' + libpath.read_text() + '\n}'
+    try:
+        return LibertyToJSONParser.load_timing_info_from_text(libfile), None
+    except LibertyToJSONParser.LibertyToJSONParserException as ex:
+        return None, '{}: {}'.format(libpath, ex.message)
 
 
 def main():
     parser = argparse.ArgumentParser()
     parser.add_argument(
             "input",
-            help="LIB file containing timings",
+            help="LIB files containing timings",
+            nargs='+',
             type=Path)
     parser.add_argument(
             "output",
-            help="The output JSON file containing LIB timings",
+            help="The output JSON file containing LIB timings, or the output "
+                 "directory for JSON files if multiple LIB files are given",
             type=Path)
     parser.add_argument(
             "--log-suppress-below",
@@ -263,15 +374,33 @@ def main():
 
     log_printer.SUPPRESSBELOW = args.log_suppress_below
 
-    with open(args.input, 'r') as infile:
-        libfile = infile.readlines()
-
-    libfile = ['{\n'] + libfile + ['}']
-
-    timingdict = (LibertyToJSONParser.load_timing_info_from_lib(libfile))
-
-    with open(args.output, 'w') as out:
-        json.dump(timingdict, out, indent=4)
+    if len(args.input) == 1:
+        outputs = [args.output]
+        results = [parse_lib_file(args.input[0])]
+    else:
+        outputs = [args.output / (libpath.stem + '.json')
+                   for libpath in args.input]
+        # outputs are named after the inputs, so inputs with the same name
+        # would overwrite each other's results
+        if len(set(outputs)) != len(outputs):
+            parser.error('LIB files with the same name would be written to '
+                         'the same JSON file in {}'.format(args.output))
+        args.output.mkdir(parents=True, exist_ok=True)
+        # the files are parsed independently, each one in separate process
+        with ProcessPoolExecutor() as executor:
+            results = list(executor.map(parse_lib_file, args.input))
+
+    failures = 0
+    for output, (timingdict, error) in zip(outputs, results):
+        if error:
+            log_printer.log('ERROR', error)
+            failures += 1
+            continue
+        with open(output, 'w') as out:
+            json.dump(timingdict, out, indent=4)
+
+    if failures:
+        sys.exit(1)
 
 
 if __name__ == '__main__':
@@ -3,6 +3,15 @@ from termcolor import colored
 LOGLEVELS = ["INFO", "WARNING", "ERROR", "ALL"]
 SUPPRESSBELOW = "ERROR"
 
+# priorities and colors of log types
+_LOGTYPES = {"INFO": (0, "green"),
+             "WARNING": (1, "yellow"),
+             "ERROR": (2, "red"),
+             "ALL": (3, "black")}
+
+# colored line templates of log types, created on first use
+_TEMPLATES = {}
+
 
 def log(ltype, message, outdesc=None):
     """Prints log messages.
@@ -14,15 +23,20 @@ def log(ltype, message, outdesc=None):
     message: str
         Log message
     """
-    if ltype not in LOGLEVELS[:-1]:
+    logtype = _LOGTYPES.get(ltype)
+    # "ALL" is only a suppression level, not a type of message
+    if logtype is None or ltype == "ALL":
+        return
+    priority, color = logtype
+    # suppressed messages return before any formatting
+    if priority < _LOGTYPES[SUPPRESSBELOW][0]:
         return
-    dat = {"INFO": (0, "green"),
-           "WARNING": (1, "yellow"),
-           "ERROR": (2, "red"),
-           "ALL": (3, "black")}
-    if dat[ltype][0] >= dat[SUPPRESSBELOW][0]:
-        print(colored("{}: {}".format(ltype, message), dat[ltype][1]))
-        if outdesc:
-            print(
-                    colored("{}: {}".format(ltype, message), dat[ltype][1]),
-                    file=outdesc)
+    # the color codes enclose the whole line, so the colored prefix and
+    # reset sequence are formatted once per log type
+    template = _TEMPLATES.get(ltype)
+    if template is None:
+        template = _TEMPLATES[ltype] = colored(ltype + ": {}", color)
+    line = template.format(message)
+    print(line)
+    if outdesc:
+        print(line, file=outdesc)
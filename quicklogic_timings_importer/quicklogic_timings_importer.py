@@ -1,22 +1,63 @@
 from sdf_timing import sdfparse, sdfwrite
 from sdf_timing import utils as sdfutils
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 import argparse
+import os
 import re
+import sys
 import json
 from datetime import date
 from collections import defaultdict
+from functools import lru_cache
 from .liberty_to_json import LibertyToJSONParser
 from . import log_printer
 from .log_printer import log
 
 
+# sentinel for missing dictionary entries
+_MISSING = object()
+
+
+def _keep_name(name):
+    # used in place of normalize_name when names are not normalized
+    return name
+
+
 class JSONToSDFParser():
 
-    ctypes = ['combinational', 'three_state_disable', 'three_state_enable', 'rising_edge', 'falling_edge', 'clear']
+    ctypes = frozenset(['combinational', 'three_state_disable', 'three_state_enable', 'rising_edge', 'falling_edge', 'clear'])  # noqa: E501
+
+    # timing checks and clock edges for sequential timing types, None marks
+    # ignored types
+    typestoedges = {
+        'hold_falling': ('hold', 'negedge'),
+        'hold_rising': ('hold', 'posedge'),
+        'setup_falling': ('setup', 'negedge'),
+        'setup_rising': ('setup', 'posedge'),
+        'removal_falling': ('removal', 'negedge'),
+        'removal_rising': ('removal', 'posedge'),
+        'recovery_falling': ('recovery', 'negedge'),
+        'recovery_rising': ('recovery', 'posedge'),
+    }
 
     # extracts cell name and design name, ignore kfactor value
-    headerparser = re.compile(r'^\"?(?P<cell>[a-zA-Z_][a-zA-Z_0-9]*)\"?\s*cell\s*(?P<design>[a-zA-Z_][a-zA-Z_0-9]*)\s*(?:kfactor\s*(?P<kfactor>[0-9.]*))?\s*(?:instance\s*(?P<instance>[a-zA-Z_0-9]*))?.*')  # noqa: E501
+    headerparser = re.compile(r'\"?(?P<cell>[a-zA-Z_]\w*)\"?\s*cell\s*(?P<design>[a-zA-Z_]\w*)\s*(?:kfactor\s*(?P<kfactor>[0-9.]*))?\s*(?:instance\s*(?P<instance>\w*))?', re.ASCII)  # noqa: E501
+
+    # extracts pin name and value
+    whenparser = re.compile(r"(?P<name>[a-zA-Z_]\w*(?:\[[0-9]*\])?)\s*==\s*1'b(?P<value>[0-1])(?:\s*&&)?", re.ASCII)  # noqa: E501
+
+    # intrinsic delay entries as (delval field, Liberty attribute)
+    intrinsicrisefields = (
+        ('min', 'intrinsic_rise_min'),
+        ('avg', 'intrinsic_rise'),
+        ('max', 'intrinsic_rise_max'),
+    )
+    intrinsicfallfields = (
+        ('min', 'intrinsic_fall_min'),
+        ('avg', 'intrinsic_fall'),
+        ('max', 'intrinsic_fall_max'),
+    )
 
     normalize_cell_names = True
     normalize_port_names = True
@@ -36,46 +77,20 @@ class JSONToSDFParser():
             pair of dicts containing extracted agv, max, min values from
             intrinsic rise and fall entries, respectively
         """
-        fall = {'avg': None, 'max': None, 'min': None}
         rise = {'avg': None, 'max': None, 'min': None}
+        fall = {'avg': None, 'max': None, 'min': None}
 
-        if 'intrinsic_rise_min' in libentry:
-            rise['min'] = float(libentry['intrinsic_rise_min']) * kfactor
-        if 'intrinsic_rise' in libentry:
-            rise['avg'] = float(libentry['intrinsic_rise']) * kfactor
-        if 'intrinsic_rise_max' in libentry:
-            rise['max'] = float(libentry['intrinsic_rise_max']) * kfactor
-
-        if 'intrinsic_fall_min' in libentry:
-            fall['min'] = float(libentry['intrinsic_fall_min']) * kfactor
-        if 'intrinsic_fall' in libentry:
-            fall['avg'] = float(libentry['intrinsic_fall']) * kfactor
-        if 'intrinsic_fall_max' in libentry:
-            fall['max'] = float(libentry['intrinsic_fall_max']) * kfactor
+        for field, key in cls.intrinsicrisefields:
+            value = libentry.get(key)
+            if value is not None:
+                rise[field] = float(value) * kfactor
+        for field, key in cls.intrinsicfallfields:
+            value = libentry.get(key)
+            if value is not None:
+                fall[field] = float(value) * kfactor
 
         return rise, fall
 
-    @classmethod
-    def getparsekey(cls, entrydata, direction):
-        """Generates keys for entry to corresponding parsing hook.
-
-        Parameters
-        ----------
-        entrydata: dict
-            Timing entry from Liberty-JSON structure to generate the key for
-        direction: str
-            The direction of pin, can be input, output, inout
-
-        Returns
-        -------
-        tuple: key for parser hook (direction, is_sequential)
-        """
-        defentrydata = defaultdict(lambda: None, entrydata)
-        return (
-                direction,
-                (defentrydata["timing_type"] is not None and
-                    defentrydata["timing_type"] not in cls.ctypes))
-
     @classmethod
     def is_delval_empty(cls, delval):
         """Checks if delval is empty.
@@ -117,10 +132,8 @@ class JSONToSDFParser():
         dict: SDF entry for a given pin
         """
 
-        if cls.normalize_port_names:
-            normalize = cls.normalize_name
-        else:
-            normalize = lambda x: x
+        normalize = (cls.normalize_name if cls.normalize_port_names
+                     else _keep_name)
 
         paths = {}
         paths['fast'] = delval_rise
@@ -162,38 +175,25 @@ class JSONToSDFParser():
         dict: SDF entry for a given pin
         """
 
-        typestoedges = {
-            'hold_falling': ('hold', 'negedge'),
-            'hold_rising': ('hold', 'posedge'),
-            'setup_falling': ('setup', 'negedge'),
-            'setup_rising': ('setup', 'posedge'),
-            'removal_falling': ('removal', 'negedge'),
-            'removal_rising': ('removal', 'posedge'),
-            'recovery_falling': ('recovery', 'negedge'),
-            'recovery_rising': ('recovery', 'posedge'),
-        }
-
-        if cls.normalize_port_names:
-            normalize = cls.normalize_name
-        else:
-            normalize = lambda x: x
+        normalize = (cls.normalize_name if cls.normalize_port_names
+                     else _keep_name)
 
         # combinational types, should not be present in this function
-        if ('timing_type' in entrydata and
-                entrydata['timing_type'] not in cls.ctypes):
-            timing_type = entrydata['timing_type']
-            if timing_type not in typestoedges:
+        timing_type = entrydata.get('timing_type')
+        if timing_type is not None and timing_type not in cls.ctypes:
+            edges = cls.typestoedges.get(timing_type, _MISSING)
+            if edges is _MISSING:
                 log("WARNING", "not supported timing_type: {} in {}".format(
                     timing_type, objectname))
                 return None
-            if typestoedges[timing_type] is None:
+            if edges is None:
                 log("INFO", 'timing type is ignored: {}'.format(timing_type))
                 return None
             else:
                 delays = {
                     "nominal": (delval_fall if cls.is_delval_empty(delval_rise)
                                 else delval_rise)}
-            ptype, edgetype = typestoedges[timing_type]
+            ptype, edgetype = edges
         else:
             log("ERROR", "combinational entry in sequential timing parser")
             assert entrydata['timing_type'] not in cls.ctypes
@@ -236,26 +236,24 @@ class JSONToSDFParser():
         -------
         dict: Merged entry
         """
+        # the delays of the old element are updated in place
         olddelays = oldelement["delay_paths"]
-        newdelays = newelement["delay_paths"]
-        delays = {**olddelays, **newdelays}
-        for key in delays.keys():
-            if key in olddelays and key in newdelays:
-                old = olddelays[key]
-                new = newdelays[key]
-                for dkey in old:
-                    if new[dkey] is None or (
-                            old[dkey] is not None and old[dkey] > new[dkey]):
-                        delays[key][dkey] = old[dkey]
-                    else:
-                        delays[key][dkey] = new[dkey]
-        element = oldelement
-        element["delay_paths"] = delays
-        return element
-
-    @classmethod
-    def normalize_name(cls, name):
-        # remove array markers
+        for key, new in newelement["delay_paths"].items():
+            old = olddelays.get(key)
+            if old is None:
+                olddelays[key] = new
+                continue
+            for dkey, newval in new.items():
+                oldval = old[dkey]
+                if oldval is None or (newval is not None and newval >= oldval):
+                    old[dkey] = newval
+        return oldelement
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def normalize_name(name):
+        # remove array markers, names repeat across timings so results are
+        # cached
         newname = name.replace('[','').replace(']','')
         return newname
 
@@ -284,16 +282,6 @@ class JSONToSDFParser():
             When True enables normalization of port names
         '''
 
-        # setup hooks that run different parsing functions based on current
-        # entry
-        parserhooks = {}
-
-        parserhooks[("input", True)] = [cls.parsesetuphold]
-        parserhooks[("input", False)] = [cls.parseiopath]
-        parserhooks[("inout", True)] = [cls.parsesetuphold]
-        parserhooks[("inout", False)] = [cls.parseiopath]
-        parserhooks[("output", False)] = [cls.parseiopath]
-
         cls.normalize_cell_names = normalize_cell_names
         cls.normalize_port_names = normalize_port_names
 
@@ -301,15 +289,19 @@ class JSONToSDFParser():
         headerparser = cls.headerparser
 
         # extracts pin name and value
-        whenparser = re.compile("(?P<name>[a-zA-Z_][a-zA-Z_0-9]*(\[[0-9]*\])?)\s*==\s*1'b(?P<value>[0-1])(\s*&&)?")  # noqa: E501
+        whenparser = cls.whenparser
+
+        # parse all cell headers once, library headers have no match
+        parsedheaders = [
+                None if header.startswith('library')
+                else headerparser.match(header)
+                for header, _ in parsed_data]
 
         # we generate a design name from the first header
-        header = parsed_data[0][0]
-        if header.startswith('library'):
+        if parsedheaders[0] is None:
             design = "Unknown"
         else:
-            parsedheader = headerparser.match(header)
-            design = parsedheader.group('design')
+            design = parsedheaders[0].group('design')
 
         sdfparse.sdfyacc.header = {
                 'date': date.today().strftime("%B %d, %Y"),
@@ -318,33 +310,36 @@ class JSONToSDFParser():
                 'voltage': {'avg': voltage, 'max': voltage, 'min': voltage}
                 }
 
-        cells = defaultdict(lambda: defaultdict(lambda: defaultdict(dict)))
+        cells = {}
 
-        for ld in parsed_data:
+        for ld, parsedheader in zip(parsed_data, parsedheaders):
 
-            header = ld[0]
             lib_dict = ld[1]
 
-            keys = [key for key in lib_dict.keys()]
+            libkey = next(iter(lib_dict), None)
 
-            if len(keys) != 1 or not keys[0].startswith('library'):
+            if len(lib_dict) != 1 or not libkey.startswith('library'):
                 log('ERROR', 'JSON does not represent Liberty library')
                 return None
 
 
-            if header.startswith('library'):
+            if parsedheader is None:
                 kfactor = 1.0
                 design = "Unknown"
-                instancenames = cellnames = [key.split()[1] for key in lib_dict[keys[0]].keys() if key.startswith("cell")]
-                librarycontents = [lib_dict[keys[0]][cell] for cell in lib_dict[keys[0]].keys() if cell.startswith("cell")]
+                # collect cell names and contents in a single pass
+                cellnames = []
+                librarycontents = []
+                for key, value in lib_dict[libkey].items():
+                    if key.startswith("cell"):
+                        cellnames.append(key.split(None, 2)[1])
+                        librarycontents.append(value)
+                instancenames = cellnames
             else:
-                # parse header
-                parsedheader = headerparser.match(header)
                 kfactor = float(parsedheader.group('kfactor'))
                 design = parsedheader.group('design')
                 # name of the cell
                 cellnames = [parsedheader.group('cell')]
-                librarycontents = [lib_dict[keys[0]]]
+                librarycontents = [lib_dict[libkey]]
                 instance = parsedheader.group('instance')
                 if instance is None:
                     instance = parsedheader.group('cell')
@@ -354,44 +349,48 @@ class JSONToSDFParser():
             sdfparse.init()
 
             for instancename, cellname, librarycontent in zip(instancenames, cellnames, librarycontents):
+                # Normalize cell and instance names, only the pin names in
+                # timing conditions appended to the cell name below can
+                # introduce new brackets
+                if cls.normalize_cell_names:
+                    cellname = cls.normalize_name(cellname)
+                    instancename = cls.normalize_name(instancename)
                 # for all pins in the cell
                 for objectname, obj in librarycontent.items():
                     objectname = objectname.split(' ', 1)[1]
-                    direction = obj['direction']
                     # for all timing configurations in the cell
-                    if 'timing ' in obj:
-                        elementnametotiming = defaultdict(lambda: [])
-                        for timing in (obj['timing ']
-                                       if type(obj['timing ']) is list
-                                       else [obj['timing ']]):
+                    timings = obj.get('timing ')
+                    if timings is not None:
+                        if not isinstance(timings, list):
+                            timings = (timings,)
+                        elementnametotiming = defaultdict(list)
+                        for timing in timings:
                             cname = cellname
                             if 'when' in timing:
                                 if timing["when"] != "":
                                     # normally, the sdf_cond field should contain the name
                                     # generated by the following code, but sometimes it is
                                     # not present or represented by some specific constants
-                                    condlist = ['{}_EQ_{}'
-                                                .format(entry.group('name'),
-                                                        entry.group('value'))
-                                                for entry in whenparser.finditer(
+                                    # name and value are the only capturing
+                                    # groups of whenparser, so findall yields
+                                    # (name, value) pairs
+                                    condlist = ['{}_EQ_{}'.format(name, value)
+                                                for name, value in whenparser.findall(
                                                     timing['when'])]
                                     if not condlist:
                                         log("ERROR", "when entry not parsable:  {}"
                                             .format(timing['when']))
                                         return False
-                                    cname += "_" + '_'.join(condlist)
+                                    conds = '_'.join(condlist)
+                                    if cls.normalize_cell_names:
+                                        conds = cls.normalize_name(conds)
+                                    cname += "_" + conds
 
                             # when the timing is defined for falling edge, add this
                             # info to cell name
-                            if 'timing_type' in timing:
-                                if 'falling' in timing['timing_type']:
-                                    cname += "_{}_EQ_1".format(
-                                            timing['timing_type'].upper())
-
-                            # Normalize cell and instance names
-                            if cls.normalize_cell_names:
-                                cname = cls.normalize_name(cname)
-                                instancename = cls.normalize_name(instancename)
+                            timing_type = timing.get('timing_type')
+                            if timing_type is not None and 'falling' in timing_type:
+                                cname += "_{}_EQ_1".format(timing_type.upper())
 
                             # extract intrinsic_rise and intrinsic_fall in SDF-friendly
                             # format
@@ -401,25 +400,32 @@ class JSONToSDFParser():
                             if cls.is_delval_empty(rise) and cls.is_delval_empty(fall):
                                 continue
 
-                            # run all defined hooks for given timing entry
-                            parserkey = cls.getparsekey(timing, direction)
-                            for func in parserhooks[parserkey]:
-                                element = func(rise, fall, objectname, timing)
-                                if element is not None:
-                                    # Merge duplicated entries
-                                    elname = element["name"]
-                                    if elname in cells[cname][instancename]:
-                                        element = cls.merge_delays(
-                                                cells[cname][instancename][elname],
-                                                element)
-
-                                    # memorize the timing entry responsible for given
-                                    # SDF entry
-                                    elementnametotiming[elname].append(timing)
-                                    # add SDF entry
-                                    if cls.normalize_cell_names:
-                                        elname = cls.normalize_name(elname)
-                                    cells[cname][instancename][elname] = element
+                            # run the parser for given timing entry, timings
+                            # of non-combinational types are timing checks
+                            if (timing_type is not None and
+                                    timing_type not in cls.ctypes):
+                                hook = cls.parsesetuphold
+                            else:
+                                hook = cls.parseiopath
+                            element = hook(rise, fall, objectname, timing)
+                            if element is not None:
+                                # Merge duplicated entries
+                                elname = element["name"]
+                                instancecells = cells.setdefault(
+                                        cname, {}).setdefault(
+                                                instancename, {})
+                                existing = instancecells.get(elname)
+                                if existing is not None:
+                                    element = cls.merge_delays(
+                                            existing, element)
+
+                                # memorize the timing entry responsible for given
+                                # SDF entry
+                                elementnametotiming[elname].append(timing)
+                                # add SDF entry
+                                if cls.normalize_cell_names:
+                                    elname = cls.normalize_name(elname)
+                                instancecells[elname] = element
 
         # generate SDF file from dictionaries
         sdfparse.sdfyacc.cells = cells
@@ -468,6 +474,10 @@ def main():
             "--normalize-port-names",
             action="store_true",
             help="Don't normalize port names (remove brackets)")
+    parser.add_argument(
+            "--jobs",
+            help="Number of processes parsing the cells (def. CPU count)",
+            type=int)
     parser.add_argument(
             "--log-suppress-below",
             help="The mininal not suppressed log level",
@@ -479,14 +489,12 @@ def main():
 
     log_printer.SUPPRESSBELOW = args.log_suppress_below
 
-    # Load LIB file
-    with open(args.input, 'r') as infile:
-        libfile = infile.readlines()
-
-	# remove empty lines and trailing whitespaces
-    libfile = [line.rstrip() for line in libfile if line.strip()]
-    # remove C/C++ style comments
-    libfile = [line for line in libfile if not line.startswith('/*')]
+    # Load LIB file, remove empty lines, trailing whitespaces and C/C++ style
+    # comments in a single pass over the lines, the file is read and split
+    # at once, which is cheaper than iterating over the file object
+    libfile = [line for line in map(str.rstrip,
+                                    args.input.read_text().split('\n'))
+               if line and not line.startswith('/*')]
 
     libfiles = []
     if libfile[0].startswith('library'):
@@ -497,9 +505,11 @@ def main():
     else:
         # Split the file into individual cell definitions. First identify
         # split points which are cell headers. Add the last line index in order
-        # to catch the last cell in the file.
+        # to catch the last cell in the file. Headers always contain the
+        # "cell" keyword, so other lines skip the regex.
+        headermatch = JSONToSDFParser.headerparser.match
         split_points = [i for i, line in enumerate(libfile) if \
-            JSONToSDFParser.headerparser.match(line) is not None]
+            'cell' in line and headermatch(line) is not None]
         split_points.append(len(libfile))
         # Now split the input lib file, preserve headers
         for i in range(len(split_points)-1):
@@ -511,16 +521,30 @@ def main():
             })
 
     # Parse each one
-    parsed_data = []
-    result = ""
+    texts = []
     for data in libfiles:
         data["data"][0] = r'library \({}\) {}'.format(
                             data["header"].replace(' ', '_').replace('.', '_').replace('"', ''), '{')
-        data["data"] = ['{\n'] + data["data"] + ['}']
-        timing_dict = LibertyToJSONParser.load_timing_info_from_lib(data["data"])
-        parsed_data.append((data["header"], timing_dict))
+        texts.append('{\n' + '\n'.join(data["data"]) + '\n}')
+
+    # cell definitions are independent, so they are parsed in separate
+    # processes, handed out in chunks to keep the transfers few
+    jobs = args.jobs or os.cpu_count() or 1
+    parse = LibertyToJSONParser.load_timing_info_from_text
+    if jobs > 1 and len(texts) > 1:
+        with ProcessPoolExecutor(jobs) as executor:
+            timing_dicts = list(executor.map(
+                    parse,
+                    texts,
+                    chunksize=max(1, len(texts) // (4 * jobs))))
+    else:
+        timing_dicts = [parse(text) for text in texts]
+    parsed_data = [(data["header"], timing_dict)
+                   for data, timing_dict in zip(libfiles, timing_dicts)]
 
-    result += JSONToSDFParser.export_sdf_from_lib_dict(
+    # the SDF is emitted as a single string, it is written out as is without
+    # any intermediate copies
+    result = JSONToSDFParser.export_sdf_from_lib_dict(
             args.voltage,
             parsed_data,
             args.normalize_cell_names,
@@ -533,30 +557,26 @@ def main():
     #with open("/tmp/pd.json", 'w') as fp:
     #    json.dump(parsed_data, fp, indent=4)
 
-    #libkey = [key for key in timingdict.keys()][0]
+    #libkey = next(iter(timingdict))
 
     ## sanity checking and duplicate entry handling
     #for key, value in timingdict[libkey].items():
     #    if type(value) is list:
+    #        # merge all duplicates in a single pass over their entries
     #        finalentry = dict()
-    #        for k in sorted(list(
-    #                set([key for elements in value for key in elements]))):
-    #            first = True
-    #            val = None
-    #            for duplicate in value:
-    #                if k in duplicate:
-    #                    if first:
-    #                        val = duplicate[k]
-    #                        first = False
-    #                    assert duplicate[k] == val, \
+    #        for duplicate in value:
+    #            for k, val in duplicate.items():
+    #                if k in finalentry:
+    #                    assert finalentry[k] == val, \
     #                        "ERROR: entries for {} have different" \
     #                        "values for parameter {}: {} != {}".format(
     #                                key,
     #                                k,
-    #                                val,
-    #                                duplicate[k])
-    #            finalentry[k] = val
-    #        timingdict[libkey][key] = finalentry
+    #                                finalentry[k],
+    #                                val)
+    #                else:
+    #                    finalentry[k] = val
+    #        timingdict[libkey][key] = dict(sorted(finalentry.items()))
 
     #args.json_output = "/tmp/dump.json"
     #if args.json_output:
@@ -568,6 +588,13 @@ def main():
     #        args.voltage,
     #        timingdict)
 
+    # export returns None or False on failures, which are checked before the
+    # output is opened so that a previous output is not truncated
+    if not isinstance(result, str):
+        log("ERROR", "SDF was not generated, {} is left unchanged".format(
+            args.output))
+        sys.exit(1)
+
     with open(args.output, 'w') as out:
         out.write(result)
 
@@ -6,7 +6,7 @@ import json
 from . import log_printer
 from pathlib import Path
 import argparse
-from .lib_diff import clean_lines, diff_files
+from .lib_diff import clean_lines, clean_text, diff_files
 import sys
 
 
@@ -93,14 +93,12 @@ def main():
             numfailed['comparison-json'],
             numfailed['comparison-lib'],
             libname))
-        with open(libname, 'r') as libfile:
-            inputliberty = libfile.readlines()
-        inputliberty = ['{\n'] + inputliberty + ['}']
+        inputliberty = libname.read_text()
         jsondict = {}
         # try parsing LIB file
         try:
-            jsondict = LibertyToJSONParser.load_timing_info_from_lib(
-                    inputliberty)
+            jsondict = LibertyToJSONParser.load_timing_info_from_text(
+                    '{\n' + inputliberty + '\n}')
             if args.output_json_root_dir:
                 targetfile = Path(
                         str(args.output_json_root_dir / namecore) + '.json')
@@ -127,8 +125,8 @@ def main():
                 targetfile = Path(
                         str(args.output_lib_root_dir / namecore) + '.lib')
                 targetfile.parent.mkdir(parents=True, exist_ok=True)
-                with open(targetfile, 'w') as out:
-                    out.write('\n'.join(liblines))
+                with open(targetfile, 'w', buffering=1 << 20) as out:
+                    out.writelines(line + '\n' for line in liblines)
             log_printer.log('INFO', ' json-to-lib: {}'.format(libname))
         except Exception as ex:
             log_printer.log(
@@ -167,7 +165,7 @@ def main():
             with open('{}_wrong.json'.format(filenum), 'w') as wrong:
                 json.dump(newjson, wrong, indent=2)
             numfailed['comparison-json'] += 1
-        in1 = clean_lines(inputliberty[1:-1])
+        in1 = clean_text(inputliberty)
         in2 = clean_lines(liblines[1:-1])
         similarity = diff_files(
                 in1,
@@ -0,0 +1,115 @@
+import pytest
+
+from quicklogic_timings_importer.liberty_to_json import LibertyToJSONParser
+
+
+def parse(body):
+    '''Parses Liberty content wrapped into the root group.'''
+    return LibertyToJSONParser.load_timing_info_from_text(
+            '{\n' + body + '\n}')
+
+
+def parse_values(args):
+    '''Parses "values (args);" statement in a minimal library.'''
+    return parse('library (test) {\nvalues (' + args + ');\n}')['library test']
+
+
+def test_nested_groups():
+    assert parse('''
+library (lib) {
+  cell (a) {
+    area : 1.5;
+    pin (Y) {
+      direction : output;
+      timing () { related_pin : "A"; }
+    }
+  }
+}''') == {'library lib': {'cell a': {
+        'area': '1.5',
+        'pin Y': {
+            'direction': 'output',
+            'timing ': {'related_pin': 'A'}}}}}
+
+
+def test_duplicate_entries_merged():
+    assert parse('''
+library (lib) {
+  voltage_map (VDD, 1.8);
+  voltage_map (GND, 0.0);
+  slew : 1.0;
+  slew : 1.0;
+  slew : 2.0;
+  cell (a) { area : 1; }
+  cell (a) { area : 2; }
+  pin (Y) {
+    timing () { related_pin : "A"; }
+    timing () { related_pin : "B"; }
+  }
+}''') == {'library lib': {
+        'comp_attribute voltage_map': ['VDD, 1.8', 'GND, 0.0'],
+        # equal duplicate of a single value is dropped
+        'slew': ['1.0', '2.0'],
+        'cell a': [{'area': '1'}, {'area': '2'}],
+        'pin Y': {'timing ': [{'related_pin': 'A'}, {'related_pin': 'B'}]}}}
+
+
+def test_define():
+    assert parse('''
+library (lib) {
+  define (my_attr, cell, string);
+}''') == {'library lib': {'define': {
+        'attribute_name': 'my_attr',
+        'group_name': 'cell',
+        'attribute_type': 'string'}}}
+
+
+def test_quoted_separators():
+    assert parse('''
+library (lib) {
+  comment ("a; b, c");
+  function : "A & B;";
+}''') == {'library lib': {
+        'comp_attribute comment': 'a; b, c',
+        'function': 'A & B;'}}
+
+
+def test_comments_and_line_continuations():
+    assert parse('''
+library (lib) { /* block
+  comment */ area : 1; // line comment
+  # python style comment
+  values ("1, 2", \\
+          "3.5, 4e1");
+}''') == {'library lib': {'area': '1', 'values': [[1, 2], [3.5, 40.0]]}}
+
+
+# line numbers count the opening brace of the root group added by parse
+@pytest.mark.parametrize('body, lineno', [
+    ('library (lib) {\n  area : 1;', 4),
+    ('library (lib) {\n  area : 1;\n}\n}', 6),
+    ('library (lib) {\n  pin ( {\n  }\n}', 3),
+])
+def test_malformed_input(body, lineno):
+    with pytest.raises(LibertyToJSONParser.LibertyToJSONParserException) as ex:
+        parse(body)
+    assert ex.value.lineno == lineno
+
+
+def test_arrays_parsed():
+    assert parse_values('"1, 2", "3, 4"') == {'values': [[1, 2], [3, 4]]}
+    assert parse_values('"1, 2"  "3.5"') == {'values': [[1, 2], [3.5]]}
+    assert parse_values('"1, 2, " , "3"') == {'values': [[1, 2], [3]]}
+    assert parse_values('"1.5e3"') == {'values': [1500.0]}
+
+
+def test_malformed_arrays_kept_as_complex_attribute():
+    # a malformed last array used to make the array pattern backtrack over
+    # every split of the whitespace between the rows
+    for separator in (', ', ',        '):
+        row = '"' + separator.join(['0.1'] * 7) + '"'
+        table = ', '.join([row] * 200)
+        assert len(parse_values(table)['values']) == 200
+        # unparsable arguments are kept as complex attribute, without the
+        # outer quotes
+        entry = parse_values(table + ', "1."')
+        assert entry == {'comp_attribute values': table[1:] + ', "1.'}